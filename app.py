@@ -1,69 +1,316 @@
+import csv
+import io
+import math
 import os
-
-from flask import Flask, render_template, request, redirect, session, url_for
-from cs50 import SQL
-from datetime import date
-from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+import sqlite3
+import threading
+import types
+from bisect import bisect_right
+
+import numpy as np
+import redis
+from flask import Flask, g, render_template, request, redirect, session, url_for
+from flask_compress import Compress
+from flask_session import Session
+from datetime import date, timedelta
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from werkzeug.security import check_password_hash
+
+try:
+    import orjson as json
+except ImportError:  # orjson is optional; fall back to the stdlib
+    import json
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key")
 
-# Connect directly to the SQLite database file
-db = SQL("sqlite:///golf.db")
+# Shared Redis connection (sessions live under session:<sid>)
+redis_client = redis.Redis.from_url(
+    os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+    socket_keepalive=True,
+)
+
+# Server-side sessions: the cookie only carries a random session id
+app.config["SESSION_TYPE"] = "redis"
+app.config["SESSION_REDIS"] = redis_client
+app.config["SESSION_KEY_PREFIX"] = "session:"
+app.config["SESSION_PERMANENT"] = True
+app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=7)
+Session(app)
+
+# gzip/brotli for HTML and JSON responses
+Compress(app)
+
+DATABASE = "golf.db"
+
+
+def configure_connection(conn):
+    """Apply per-connection PRAGMAs (relaxed fsync, bigger cache)."""
+    # journal_mode=WAL is persistent on the file and is set in init_db
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA cache_size=-20000")  # 20 MB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA foreign_keys=ON")
+
+
+class Database:
+    """
+    Thin stand-in for cs50.SQL on top of the sqlite3 module.
+    Each thread keeps its own long-lived connection, so sqlite3's
+    prepared-statement cache is reused across requests instead of
+    every query being parsed and planned again.
+    That reuse only happens when threads are long-lived, e.g. gunicorn
+    sync or gthread workers. The development server (app.run) starts a
+    thread per request, so there every request opens fresh connections;
+    they are closed when the thread exits and its thread-local is freed.
+    Return values follow cs50: SELECT -> list of dicts,
+    INSERT -> new row id, anything else -> affected row count.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                # Readers never take the write lock
+                target, uri = f"file:{self.path}?mode=ro", True
+            else:
+                target, uri = self.path, False
+            # isolation_level=None: autocommit unless we BEGIN explicitly
+            conn = sqlite3.connect(
+                target,
+                uri=uri,
+                isolation_level=None,
+                cached_statements=256,
+            )
+            conn.row_factory = sqlite3.Row
+            configure_connection(conn)
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, *args):
+        cursor = self._connection().execute(sql, args)
+        if cursor.description is not None:
+            return [dict(row) for row in cursor.fetchall()]
+        if sql.lstrip().upper().startswith("INSERT"):
+            return cursor.lastrowid
+        return cursor.rowcount
+
+    def executemany(self, sql, rows):
+        return self._connection().executemany(sql, rows).rowcount
+
+
+# Writer for INSERT/UPDATE/DELETE and schema changes, readers for SELECTs
+db_w = Database(DATABASE)
+db_r = Database(DATABASE, read_only=True)
+
+# Hot queries kept as constants so every call sends identical SQL text
+# (and hits the same cached prepared statement)
+SQL_CLUBS_FOR_USER = """
+    SELECT id, name, notes
+    FROM clubs
+    WHERE user_id = ?
+    ORDER BY COALESCE(bag_order, 999), name
+"""
+# Blank/missing date defaults to today (server local time)
+SQL_INSERT_SHOT = """
+    INSERT INTO shots (club_id, date, distance, result, context)
+    VALUES (?, COALESCE(NULLIF(?, ''), DATE('now', 'localtime')), ?, ?, ?)
+"""
+
+
+# Shared by init_db for fresh databases and for rebuilding old ones
+SHOTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+        club_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        distance REAL NOT NULL,
+        result TEXT,
+        context TEXT,
+        result_norm TEXT GENERATED ALWAYS AS
+            (LOWER(TRIM(COALESCE(result, '')))) VIRTUAL,
+        FOREIGN KEY (club_id) REFERENCES clubs(id) ON DELETE CASCADE
+    )
+"""
+
 
 def init_db():
     """Create tables if they do not exist (for fresh databases)."""
-    db.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
-            username TEXT NOT NULL UNIQUE,
-            hash TEXT NOT NULL
+    # WAL has to be in place before the first page is written
+    db_w.execute("PRAGMA journal_mode=WAL")
+
+    # The shots rebuild below copies rows that may point at deleted clubs
+    # (the baseline never enforced foreign keys). SQLite only allows this
+    # PRAGMA outside a transaction, so turn enforcement off around it.
+    db_w.execute("PRAGMA foreign_keys=OFF")
+
+    # Run the whole bootstrap as one transaction, so it costs a single fsync
+    db_w.execute("BEGIN IMMEDIATE")
+    try:
+        db_w.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                username TEXT NOT NULL UNIQUE,
+                hash TEXT NOT NULL
+            )
+            """
         )
-        """
-    )
 
-    db.execute(
-        """
-        CREATE TABLE IF NOT EXISTS clubs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            loft REAL,
-            notes TEXT,
-            bag_order INTEGER,
-            FOREIGN KEY (user_id) REFERENCES users(id)
+        db_w.execute(
+            """
+            CREATE TABLE IF NOT EXISTS clubs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                loft REAL,
+                notes TEXT,
+                bag_order INTEGER,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+            """
         )
-        """
-    )
 
-    db.execute(
-        """
-        CREATE TABLE IF NOT EXISTS shots (
-            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
-            club_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            distance REAL NOT NULL,
-            result TEXT,
-            context TEXT,
-            FOREIGN KEY (club_id) REFERENCES clubs(id)
+        db_w.execute(SHOTS_SCHEMA.format(table="shots"))
+
+        # Older databases created shots without ON DELETE CASCADE (or without
+        # any foreign key); SQLite cannot alter a foreign key, so rebuild the
+        # table with the new schema
+        foreign_keys = db_w.execute("PRAGMA foreign_key_list(shots)")
+        if not any(fk["on_delete"] == "CASCADE" for fk in foreign_keys):
+            db_w.execute(SHOTS_SCHEMA.format(table="shots_new"))
+            db_w.execute(
+                "INSERT INTO shots_new (id, club_id, date, distance, result, context) "
+                "SELECT id, club_id, date, distance, result, context FROM shots"
+            )
+            db_w.execute("DROP TABLE shots")
+            db_w.execute("ALTER TABLE shots_new RENAME TO shots")
+
+            # Shots whose club no longer exists never show up in any view
+            # (everything joins clubs); drop them so the new FK holds
+            for violation in db_w.execute("PRAGMA foreign_key_check(shots)"):
+                db_w.execute("DELETE FROM shots WHERE id = ?", violation["rowid"])
+
+        # Older databases predate result_norm: add it as a virtual column.
+        # (table_xinfo, unlike table_info, also lists generated columns)
+        columns = db_w.execute("PRAGMA table_xinfo(shots)")
+        if "result_norm" not in {column["name"] for column in columns}:
+            db_w.execute(
+                "ALTER TABLE shots ADD COLUMN result_norm TEXT GENERATED ALWAYS AS "
+                "(LOWER(TRIM(COALESCE(result, '')))) VIRTUAL"
+            )
+
+        # Indexes for the hot paths: a user's clubs in bag order, and a club's
+        # shots newest first (also serves the per-club GROUP BY in /stats).
+        # users.username is already covered by its UNIQUE constraint.
+        existing_indexes = {
+            row["name"]
+            for row in db_w.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        }
+        db_w.execute(
+            "CREATE INDEX IF NOT EXISTS idx_clubs_user_bag "
+            "ON clubs (user_id, bag_order, name)"
         )
-        """
-    )
+        db_w.execute(
+            "CREATE INDEX IF NOT EXISTS idx_shots_club_date_id "
+            "ON shots (club_id, date DESC, id DESC)"
+        )
+        # Superseded by idx_shots_club_date_id
+        db_w.execute("DROP INDEX IF EXISTS shots_club_date")
+
+        # Gather planner statistics once, when the indexes are first created
+        # (not on every worker start: ANALYZE scans every table)
+        if not {"idx_clubs_user_bag", "idx_shots_club_date_id"} <= existing_indexes:
+            db_w.execute("ANALYZE")
+    except Exception:
+        db_w.execute("ROLLBACK")
+        raise
+    else:
+        db_w.execute("COMMIT")
+    finally:
+        db_w.execute("PRAGMA foreign_keys=ON")
 
 
 # Make sure tables exist (safe to run even if they already do)
 init_db()
 
 
-def login_required(f):
-    @wraps(f)
-    def wrapped(*args, **kwargs):
-        if "user_id" not in session:
-            return redirect("/login")
-        return f(*args, **kwargs)
-    return wrapped
+# Argon2id tuned to roughly 100 ms per hash
+PH = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+
+def verify_password(user_id, stored_hash, password):
+    """
+    Check a password against the stored hash.
+    Older accounts still have Werkzeug PBKDF2 hashes; those (and argon2
+    hashes with outdated parameters) are upgraded on a successful login.
+    """
+    if stored_hash.startswith("$argon2"):
+        try:
+            PH.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        needs_rehash = PH.check_needs_rehash(stored_hash)
+    else:
+        if not check_password_hash(stored_hash, password):
+            return False
+        needs_rehash = True
+
+    if needs_rehash:
+        db_w.execute(
+            "UPDATE users SET hash = ? WHERE id = ?",
+            PH.hash(password),
+            user_id,
+        )
+    return True
+
+
+# Endpoints reachable without logging in
+PUBLIC_ENDPOINTS = frozenset({"login", "register", "logout", "static"})
+
+
+@app.before_request
+def require_login():
+    """Redirect anonymous users to /login; expose the user id as g.user_id."""
+    # Unmatched URLs have no endpoint; let them fall through to a 404
+    if request.endpoint is None or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    if "user_id" not in session:
+        return redirect("/login")
+    g.user_id = session["user_id"]
+    return None
+
+
+CLUBS_CACHE_TTL = 3600  # seconds
+
+
+def get_user_clubs(user_id):
+    """Return a user's clubs for the shot dropdown, cached in Redis."""
+    key = f"clubs:{user_id}"
+    cached = redis_client.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    clubs = db_r.execute(SQL_CLUBS_FOR_USER, user_id)
+    redis_client.set(key, json.dumps(clubs), ex=CLUBS_CACHE_TTL)
+    return clubs
+
+
+def invalidate_user_clubs(user_id):
+    """Drop the cached club list after any change to a user's clubs."""
+    redis_client.delete(f"clubs:{user_id}")
+
+
+def invalidate_spray(user_id):
+    """Drop every cached spray payload (all dates) for a user."""
+    redis_client.delete(f"spray:{user_id}")
 
 
 @app.route("/register", methods=["GET", "POST"])
@@ -80,11 +327,11 @@ def register():
             return "Passwords do not match", 400
 
         # Hash the password
-        hash_value = generate_password_hash(password)
+        hash_value = PH.hash(password)
 
         # Try to insert; fail if username is taken
         try:
-            db.execute(
+            db_w.execute(
                 "INSERT INTO users (username, hash) VALUES (?, ?)",
                 username,
                 hash_value,
@@ -94,9 +341,11 @@ def register():
             return "Username already taken", 400
 
         # Log the user in immediately (optional but nice)
-        row = db.execute("SELECT id FROM users WHERE username = ?", username)[0]
+        row = db_w.execute("SELECT id FROM users WHERE username = ?", username)[0]
         session["user_id"] = row["id"]
         session["username"] = username
+        # New session id on login, so a pre-login id cannot be fixed on the user
+        app.session_interface.regenerate(session)
 
         return redirect("/")
 
@@ -116,12 +365,16 @@ def login():
         if not username or not password:
             return "Must provide username and password", 400
 
-        rows = db.execute("SELECT * FROM users WHERE username = ?", username)
-        if len(rows) != 1 or not check_password_hash(rows[0]["hash"], password):
+        rows = db_r.execute(
+            "SELECT id, username, hash FROM users WHERE username = ?", username
+        )
+        if len(rows) != 1 or not verify_password(rows[0]["id"], rows[0]["hash"], password):
             return "Invalid username or password", 400
 
         session["user_id"] = rows[0]["id"]
         session["username"] = rows[0]["username"]
+        # New session id on login, so a pre-login id cannot be fixed on the user
+        app.session_interface.regenerate(session)
 
         return redirect("/")
 
@@ -134,7 +387,7 @@ def logout():
     return redirect("/login")
 
 
-CLUB_ORDER = {
+CLUB_ORDER = types.MappingProxyType({
     "driver": 10,
     "mini-driver": 15,
     "3 wood": 20,
@@ -164,9 +417,17 @@ CLUB_ORDER = {
     "lw": 240,
 
     "putter": 300,
-}
+})
 
-# Determine custom lofts for wedges
+# Determine custom lofts for wedges: (low loft, high loft, bag_order)
+WEDGE_RANGES = (
+    (44, 48, 205),
+    (48, 52, 215),
+    (52, 56, 225),
+    (56, 60, 235),
+    (60, 999, 245),
+)
+WEDGE_LOWS = tuple(low for low, _, _ in WEDGE_RANGES)
 
 
 def determine_bag_order(name, loft_value):
@@ -195,30 +456,23 @@ def determine_bag_order(name, loft_value):
         except (TypeError, ValueError):
             loft_num = None
 
-        if loft_num is not None:
-            if 44 <= loft_num < 48:
-                return 205      # 44–47.9
-            elif 48 <= loft_num < 52:
-                return 215      # 48–51.9
-            elif 52 <= loft_num < 56:
-                return 225      # 52–55.9
-            elif 56 <= loft_num < 60:
-                return 235      # 56–59.9
-            elif loft_num >= 60:
-                return 245      # 60+
+        # NaN compares false to every bound but bisect puts it in the last
+        # slot; treat it as no loft (inf still counts as 60+, as before)
+        if loft_num is not None and not math.isnan(loft_num):
+            idx = bisect_right(WEDGE_LOWS, loft_num) - 1
+            if 0 <= idx < len(WEDGE_RANGES):
+                return WEDGE_RANGES[idx][2]
 
     # Fallback: unknown club -> bottom of list
     return 999
 
 
 @app.route("/")
-@login_required
 def index():
     """Show home page"""
     return render_template("index.html")
 
 @app.route("/clubs", methods=["GET", "POST"])
-@login_required
 def clubs():
     """Show clubs and allow adding a new one"""
     if request.method == "POST":
@@ -242,10 +496,10 @@ def clubs():
 
         # Use helper to determine bag_order (name + loft ranges)
         bag_order = determine_bag_order(name, loft_value)
-        user_id = session["user_id"]
+        user_id = g.user_id
 
         # Insert into database
-        db.execute(
+        db_w.execute(
             "INSERT INTO clubs (name, loft, notes, bag_order, user_id) VALUES (?, ?, ?, ?, ?)",
             name,
             loft_value,
@@ -253,14 +507,15 @@ def clubs():
             bag_order,
             user_id,
         )
+        invalidate_user_clubs(user_id)
 
         # Redirect to /clubs so refresh doesn't resubmit the form
         return redirect("/clubs")
 
     # GET request: just show the page
-    user_id = session["user_id"]
+    user_id = g.user_id
 
-    clubs = db.execute("SELECT id, name, loft, notes, bag_order FROM clubs WHERE user_id = ? "
+    clubs = db_r.execute("SELECT id, name, loft, notes, bag_order FROM clubs WHERE user_id = ? "
                        "ORDER BY COALESCE(bag_order, 999), name",
                        user_id,
                        )
@@ -270,16 +525,7 @@ def clubs():
 @app.route("/clubs/<int:club_id>/edit", methods=["GET", "POST"])
 def edit_club(club_id):
     """Edit an existing club"""
-
-    # Fetch the club
-    rows = db.execute(
-        "SELECT id, name, loft, notes FROM clubs WHERE id = ?",
-        club_id,
-    )
-    if len(rows) != 1:
-        return "Club not found", 404
-
-    club = rows[0]
+    user_id = g.user_id
 
     if request.method == "POST":
         name = request.form.get("name")
@@ -297,43 +543,70 @@ def edit_club(club_id):
             except ValueError:
                 return "Loft must be a number", 400
 
-        # Recalculate bag_order from the new name
-        key = name.strip().lower()
-        bag_order = CLUB_ORDER.get(key, 999)
+        # Recalculate bag_order from the new name (and loft)
+        bag_order = determine_bag_order(name, loft_value)
 
-        db.execute(
+        # Only touches the club if it belongs to this user
+        updated = db_w.execute(
             "UPDATE clubs "
             "SET name = ?, loft = ?, notes = ?, bag_order = ? "
-            "WHERE id = ?",
+            "WHERE id = ? AND user_id = ?",
             name,
             loft_value,
             notes,
             bag_order,
             club_id,
+            user_id,
         )
+        if updated != 1:
+            return "Club not found", 404
+
+        invalidate_user_clubs(user_id)
+        invalidate_spray(user_id)
 
         return redirect("/clubs")
 
-    # GET: show edit form
-    return render_template("edit_club.html", club=club)
+    # GET: fetch the club and show the edit form
+    rows = db_r.execute(
+        "SELECT id, name, loft, notes FROM clubs WHERE id = ? AND user_id = ?",
+        club_id,
+        user_id,
+    )
+    if len(rows) != 1:
+        return "Club not found", 404
+
+    return render_template("edit_club.html", club=rows[0])
 
 
 @app.route("/clubs/<int:club_id>/delete", methods=["POST"])
 def delete_club(club_id):
     """Delete a club and all its shots"""
-    # First delete shots that reference this club
-    db.execute("DELETE FROM shots WHERE club_id = ?", club_id)
-    # Then delete the club itself
-    db.execute("DELETE FROM clubs WHERE id = ?", club_id)
+    user_id = g.user_id
+
+    # Its shots go with it via ON DELETE CASCADE
+    deleted = db_w.execute(
+        "DELETE FROM clubs WHERE id = ? AND user_id = ?",
+        club_id,
+        user_id,
+    )
+    if deleted != 1:
+        return "Club not found", 404
+
+    invalidate_user_clubs(user_id)
+    invalidate_spray(user_id)
     return redirect("/clubs")
 
 
+SHOTS_PAGE_SIZE = 50
+SPRAY_LIMIT = 2000  # max dots drawn on the /stats spray chart
+SPRAY_CACHE_TTL = 30  # seconds
+
+
 @app.route("/shots", methods=["GET", "POST"])
-@login_required
 def shots():
     """Log new shots and list shots (optionally filtered by date)."""
 
-    user_id = session["user_id"]
+    user_id = g.user_id
 
     # ----- Handle new shot submission -----
     if request.method == "POST":
@@ -343,10 +616,6 @@ def shots():
         result = request.form.get("result") or None
         context = request.form.get("context") or None
 
-        # Default date to today if left empty
-        if not date_str:
-            date_str = date.today().isoformat()
-
         # Basic validation
         if not club_id or not distance_str:
             return redirect("/shots")
@@ -356,17 +625,26 @@ def shots():
         except ValueError:
             return redirect("/shots")
 
-        db.execute(
-            """
-            INSERT INTO shots (club_id, date, distance, result, context)
-            VALUES (?, ?, ?, ?, ?)
-            """,
+        # The club must exist and belong to this user (foreign keys are
+        # enforced, so an unknown club_id would otherwise fail the INSERT)
+        owned = db_r.execute(
+            "SELECT 1 FROM clubs WHERE id = ? AND user_id = ?",
+            club_id,
+            user_id,
+        )
+        if not owned:
+            return redirect("/shots")
+
+        # An empty date falls back to today inside SQL_INSERT_SHOT
+        db_w.execute(
+            SQL_INSERT_SHOT,
             club_id,
             date_str,
             distance_value,
             result,
             context,
         )
+        invalidate_spray(user_id)
 
         return redirect("/shots")
 
@@ -375,16 +653,17 @@ def shots():
     # Optional ?date=YYYY-MM-DD in the query string
     selected_date = request.args.get("date")
 
-    # Clubs for the dropdown (only this user's clubs)
-    clubs = db.execute(
-        """
-        SELECT id, name, notes
-        FROM clubs
-        WHERE user_id = ?
-        ORDER BY COALESCE(bag_order, 999), name
-        """,
-        user_id,
-    )
+    # Page size, plus an optional keyset cursor (last row of previous page)
+    try:
+        limit = max(1, min(int(request.args.get("limit", SHOTS_PAGE_SIZE)), 200))
+    except ValueError:
+        limit = SHOTS_PAGE_SIZE
+    cursor_bag = request.args.get("cursor_bag", type=int)
+    cursor_date = request.args.get("cursor_date")
+    cursor_id = request.args.get("cursor_id", type=int)
+
+    # Clubs for the dropdown (only this user's clubs, cached in Redis)
+    clubs = get_user_clubs(user_id)
 
     # Build the shot list query
     base_query = """
@@ -406,29 +685,130 @@ def shots():
         base_query += " AND shots.date = ?\n"
         params.append(selected_date)
 
+    # Continue after the cursor in (bag_order, date DESC, id DESC) order
+    if cursor_bag is not None and cursor_date and cursor_id is not None:
+        base_query += """
+          AND (COALESCE(clubs.bag_order, 999) > ?
+               OR (COALESCE(clubs.bag_order, 999) = ?
+                   AND (shots.date, shots.id) < (?, ?)))
+        """
+        params.extend([cursor_bag, cursor_bag, cursor_date, cursor_id])
+
+    # Fetch one extra row to know whether there is a next page
     base_query += """
         ORDER BY bag_order,
                  shots.date DESC,
                  shots.id DESC
+        LIMIT ?
     """
-
-    rows = db.execute(base_query, *params)
+    params.append(limit + 1)
+
+    rows = db_r.execute(base_query, *params)
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_url = url_for(
+            "shots",
+            date=selected_date or None,
+            limit=limit,
+            cursor_bag=last["bag_order"],
+            cursor_date=last["date"],
+            cursor_id=last["id"],
+        )
 
     return render_template(
         "shots.html",
         shots=rows,
         clubs=clubs,
         selected_date=selected_date,
+        next_url=next_url,
+    )
+
+
+@app.route("/shots/bulk", methods=["POST"])
+def bulk_shots():
+    """
+    Log many shots in one request from a CSV form field, one shot per line:
+    club_id,date,distance[,result[,context]]  (blank date -> today)
+    """
+    user_id = g.user_id
+
+    rows = []
+    reader = csv.reader(io.StringIO(request.form.get("csv", "")))
+    try:
+        for line in reader:
+            fields = [field.strip() for field in line]
+
+            # Skip blank lines and an optional header row
+            if not any(fields) or fields[0].lower() == "club_id":
+                continue
+            if len(fields) < 3:
+                return f"Line {reader.line_num}: need club_id, date and distance", 400
+
+            fields += [""] * (5 - len(fields))
+            club_id, date_str, distance_str, result, context = fields[:5]
+            try:
+                club_id = int(club_id)
+                distance_value = float(distance_str)
+            except ValueError:
+                return f"Line {reader.line_num}: club_id and distance must be numbers", 400
+            if not math.isfinite(distance_value):
+                return f"Line {reader.line_num}: distance must be a finite number", 400
+
+            # Stored dates must be YYYY-MM-DD so filtering and ordering work
+            if date_str:
+                try:
+                    date_str = date.fromisoformat(date_str).isoformat()
+                except ValueError:
+                    return f"Line {reader.line_num}: date must be YYYY-MM-DD", 400
+
+            rows.append(
+                (
+                    club_id,
+                    date_str,
+                    distance_value,
+                    result or None,
+                    context or None,
+                )
+            )
+    except csv.Error:
+        return f"Line {reader.line_num}: malformed CSV", 400
+
+    if not rows:
+        return "No shots to import", 400
+
+    # Every club referenced must belong to this user (one query for all)
+    club_ids = sorted({row[0] for row in rows})
+    placeholders = ", ".join("?" * len(club_ids))
+    owned = db_r.execute(
+        f"SELECT id FROM clubs WHERE user_id = ? AND id IN ({placeholders})",
+        user_id,
+        *club_ids,
     )
+    if len(owned) != len(club_ids):
+        return "Unknown club in upload", 400
+
+    # All rows in a single transaction -> one fsync for the whole batch
+    db_w.execute("BEGIN IMMEDIATE")
+    try:
+        db_w.executemany(SQL_INSERT_SHOT, rows)
+    except Exception:
+        db_w.execute("ROLLBACK")
+        raise
+    db_w.execute("COMMIT")
+    invalidate_spray(user_id)
+
+    return "", 204
 
 
 @app.route("/shots/<int:shot_id>/delete", methods=["POST"])
-@login_required
 def delete_shot(shot_id):
-    user_id = session["user_id"]
+    user_id = g.user_id
 
     # Only delete if the shot belongs to a club owned by this user
-    db.execute(
+    db_w.execute(
         """
         DELETE FROM shots
         WHERE id = ?
@@ -437,155 +817,87 @@ def delete_shot(shot_id):
         shot_id,
         user_id,
     )
+    invalidate_spray(user_id)
 
     return redirect("/shots")
 
 
-@app.route("/stats")
-@login_required
-def stats():
-    """Show average distance, miss pattern per club, and spray chart (optionally filtered by date)"""
-
-    selected_date = request.args.get("date")  # e.g. "2025-12-07" or None
-    user_id = session["user_id"]
-
-    # Average distance + shot count per club
+# Miss bucket for a shot, from its normalised result text. Shared by the
+# /stats table and the spray chart so both classify shots the same way.
+# The WHEN order matters: a "pull hook" counts as left, not as a draw.
+# Blank results get NULL (counted in no bucket, plotted in the center lane).
+MISS_BUCKET_SQL = """
+    CASE
+        WHEN result_norm = '' THEN NULL
+        WHEN result_norm LIKE '%left%' OR result_norm LIKE '%hook%'
+             OR result_norm LIKE '%pull%' THEN 'left'
+        WHEN result_norm LIKE '%draw%' THEN 'center_left'
+        WHEN result_norm LIKE '%right%' OR result_norm LIKE '%slice%'
+             OR result_norm LIKE '%push%' THEN 'right'
+        WHEN result_norm LIKE '%cut%' OR result_norm LIKE '%fade%' THEN 'center_right'
+        WHEN result_norm LIKE '%center%' OR result_norm LIKE '%straight%'
+             OR result_norm LIKE '%pure%' THEN 'center'
+        ELSE 'other'
+    END
+"""
+BUCKETS = ("left", "center_left", "right", "center_right", "center", "other")
+# Horizontal spray-chart lane for each bucket (blank/other -> center)
+LANES = {"left": -2, "center_left": -1, "right": 2, "center_right": 1}
+
+
+# Spray-chart colors, assigned to clubs in bag order
+PALETTE = (
+    "#ef4444",  # red
+    "#3b82f6",  # blue
+    "#22c55e",  # green
+    "#f97316",  # orange
+    "#a855f7",  # purple
+    "#14b8a6",  # teal
+    "#eab308",  # yellow
+    "#6b7280",  # gray
+)
+
+
+def build_spray_data(user_id, selected_date):
+    """Dots, distance ticks and legend for the spray chart."""
+    # Clubs with at least one shot (in scope), in bag order, same as /stats
     club_query = """
-        SELECT clubs.id,
-               clubs.name,
-               clubs.notes,
-               ROUND(AVG(shots.distance), 1) AS avg_distance,
-               COUNT(*) AS shot_count
-        FROM shots
-        JOIN clubs ON shots.club_id = clubs.id
+        SELECT clubs.id, clubs.name, clubs.notes
+        FROM clubs
         WHERE clubs.user_id = ?
+          AND EXISTS (
+              SELECT 1 FROM shots
+              WHERE shots.club_id = clubs.id
     """
     club_params = [user_id]
     if selected_date:
-        club_query += " AND shots.date = ?\n"
+        club_query += " AND shots.date = ?"
         club_params.append(selected_date)
-
     club_query += """
-        GROUP BY clubs.id, clubs.name, clubs.notes
-        HAVING COUNT(*) > 0
+          )
         ORDER BY COALESCE(clubs.bag_order, 999), clubs.name
     """
-    club_stats = db.execute(club_query, *club_params)
-
-    # Miss distribution per club (for percentages)
-    miss_query = """
-        SELECT clubs.id,
-               LOWER(TRIM(COALESCE(shots.result, ''))) AS result,
-               COUNT(*) AS count
-        FROM shots
-        JOIN clubs ON shots.club_id = clubs.id
-        WHERE clubs.user_id = ?
-    """
-    miss_params = [user_id]
-    if selected_date:
-        miss_query += """
-          AND shots.date = ?
-          AND shots.result IS NOT NULL
-          AND TRIM(shots.result) != ''
-        """
-        miss_params.append(selected_date)
-    else:
-        miss_query += """
-          AND shots.result IS NOT NULL
-          AND TRIM(shots.result) != ''
-        """
-
-    miss_query += """
-        GROUP BY clubs.id, result
-    """
-    miss_rows = db.execute(miss_query, *miss_params)
-
-    miss_counts = {}
-    for row in miss_rows:
-        cid = row["id"]
-        r = row["result"]
-        count = row["count"]
-
-        if cid not in miss_counts:
-            miss_counts[cid] = {
-                "left": 0,
-                "center_left": 0,
-                "center": 0,
-                "center_right": 0,
-                "right": 0,
-                "other": 0,
-            }
-
-        if "left" in r or "hook" in r or "pull" in r:
-            miss_counts[cid]["left"] += count
-        elif "draw" in r:
-            miss_counts[cid]["center_left"] += count
-        elif "right" in r or "slice" in r or "push" in r:
-            miss_counts[cid]["right"] += count
-        elif "cut" in r or "fade" in r:
-            miss_counts[cid]["center_right"] += count
-        elif "center" in r or "straight" in r or "pure" in r:
-            miss_counts[cid]["center"] += count
-        else:
-            miss_counts[cid]["other"] += count
-
-    # Attach percentages to each club row
-    for row in club_stats:
-        cid = row["id"]
-        total = row["shot_count"]
-        counts = miss_counts.get(
-            cid,
-            {
-                "left": 0,
-                "center_left": 0,
-                "center": 0,
-                "center_right": 0,
-                "right": 0,
-                "other": 0,
-            },
-        )
-
-        if total > 0:
-            row["left_pct"] = round(100 * counts["left"] / total, 1)
-            row["center_left_pct"] = round(100 * counts["center_left"] / total, 1)
-            row["center_pct"] = round(100 * counts["center"] / total, 1)
-            row["center_right_pct"] = round(100 * counts["center_right"] / total, 1)
-            row["right_pct"] = round(100 * counts["right"] / total, 1)
-            row["other_pct"] = round(100 * counts["other"] / total, 1)
-        else:
-            row["left_pct"] = row["center_left_pct"] = row["center_pct"] = 0.0
-            row["center_right_pct"] = row["right_pct"] = row["other_pct"] = 0.0
-
-    # 4) Dispersion chart data
-
-    # Map club id -> label (name + notes)
-    club_labels = {}
-    for row in club_stats:
+    spray_clubs = db_r.execute(club_query, *club_params)
+
+    # One pass over the clubs: position lookup plus parallel label
+    # (name + notes) and color lists that each dot indexes directly
+    club_idx = {}
+    club_labels = []
+    club_colors = []
+    for idx, row in enumerate(spray_clubs):
+        club_idx[row["id"]] = idx
         label = row["name"]
         if row["notes"]:
             label = f"{label} – {row['notes']}"
-        club_labels[row["id"]] = label
-
-    # Assign each club a color
-    palette = [
-        "#ef4444",  # red
-        "#3b82f6",  # blue
-        "#22c55e",  # green
-        "#f97316",  # orange
-        "#a855f7",  # purple
-        "#14b8a6",  # teal
-        "#eab308",  # yellow
-        "#6b7280",  # gray
-    ]
-    club_colors = {}
-    for idx, row in enumerate(club_stats):
-        club_colors[row["id"]] = palette[idx % len(palette)]
+        club_labels.append(label)
+        club_colors.append(PALETTE[idx % len(PALETTE)])
 
     # Pull all individual shots (for dots), scoped to this user (and date if set)
-    raw_query = """
+    raw_query = f"""
         SELECT shots.id,
                shots.distance,
-               LOWER(TRIM(COALESCE(shots.result, ''))) AS result,
+               shots.result_norm AS result,
+               {MISS_BUCKET_SQL} AS miss,
                clubs.id AS club_id
         FROM shots
         JOIN clubs ON shots.club_id = clubs.id
@@ -596,22 +908,31 @@ def stats():
         raw_query += " AND shots.date = ?"
         raw_params.append(selected_date)
 
-    raw_shots = db.execute(raw_query, *raw_params)
+    # Only plot the most recent shots; the stats table still covers all of them
+    raw_query += " ORDER BY shots.date DESC, shots.id DESC LIMIT ?"
+    raw_params.append(SPRAY_LIMIT)
+
+    raw_shots = db_r.execute(raw_query, *raw_params)
+
+    # Distances and lanes as arrays so the dot math runs vectorized
+    dist = np.fromiter(
+        (s["distance"] or 0.0 for s in raw_shots),
+        dtype=float,
+        count=len(raw_shots),
+    )
+    lane = np.fromiter(
+        (LANES.get(s["miss"], 0) for s in raw_shots),
+        dtype=np.int8,
+        count=len(raw_shots),
+    )
 
     # Determine chart max distance (round up to next 50 yards)
     range_ticks = []
-    if raw_shots:
-        raw_max = max(
-            (s["distance"] for s in raw_shots if s["distance"] is not None),
-            default=0,
-        )
-        if raw_max <= 0:
-            chart_max = 50
-        else:
-            chart_max = ((int(raw_max) + 49) // 50) * 50
-    else:
-        raw_max = 0
+    raw_max = dist.max() if dist.size else 0
+    if raw_max <= 0:
         chart_max = 50
+    else:
+        chart_max = ((int(raw_max) + 49) // 50) * 50
 
     step = 50
     current = step
@@ -621,66 +942,122 @@ def stats():
         range_ticks.append({"value": current, "y": round(y_tick, 1)})
         current += step
 
-    # Build dispersion dots
-    spray_shots = []
-    for s in raw_shots:
-        dist = s["distance"] or 0.0
-        r = s["result"]
-        cid = s["club_id"]
-
-        norm = dist / chart_max if chart_max > 0 else 0
-        dot_offset = 3.9
-        y = 5 + norm * 90 - dot_offset
-        if y < 5:
-            y = 5
-        if y > 95:
-            y = 95
-
-        if "left" in r or "hook" in r or "pull" in r:
-            lane = -2
-        elif "draw" in r:
-            lane = -1
-        elif "right" in r or "slice" in r or "push" in r:
-            lane = 2
-        elif "cut" in r or "fade" in r:
-            lane = 1
-        elif "center" in r or "straight" in r or "pure" in r:
-            lane = 0
-        else:
-            lane = 0
-
-        x = 50 + lane * 10
-        x = max(5, min(95, x))
-
-        spray_shots.append(
-            {
-                "x": round(x, 1),
-                "y": round(y, 1),
-                "color": club_colors.get(cid, "#6b7280"),
-                "label": club_labels.get(cid, "Unknown club"),
-                "distance": round(dist, 1),
-                "result_raw": r or "",
-            }
+    # Build dispersion dots: y scaled by distance (minus the dot offset),
+    # x by miss lane, both clamped to the range box. Values are rounded with
+    # Python's round() below: np.round scales first and can differ on halves
+    # (16.85 -> 16.8 instead of 16.9)
+    dot_offset = 3.9
+    ys = np.clip(5 + (dist / chart_max) * 90 - dot_offset, 5, 95)
+    xs = np.clip(50 + lane * 10, 5, 95)
+
+    # Club position per dot, looked up once (-1 = not in spray_clubs)
+    shot_club = [club_idx.get(s["club_id"], -1) for s in raw_shots]
+
+    spray_shots = [
+        {
+            "x": x,
+            "y": round(y, 1),
+            "color": club_colors[i] if i >= 0 else "#6b7280",
+            "label": club_labels[i] if i >= 0 else "Unknown club",
+            "distance": round(d, 1),
+            "result": s["result"] or "",
+        }
+        for s, i, x, y, d in zip(
+            raw_shots,
+            shot_club,
+            xs.tolist(),
+            ys.tolist(),
+            dist.tolist(),
         )
+    ]
+
+    spray_legend = [
+        {"label": label, "color": color}
+        for label, color in zip(club_labels, club_colors)
+    ]
+
+    return {"dots": spray_shots, "ticks": range_ticks, "legend": spray_legend}
+
+
+def get_spray_json(user_id, selected_date):
+    """Return the encoded spray payload, cached briefly in Redis."""
+    key = f"spray:{user_id}"
+    field = selected_date or "all"
+    cached = redis_client.hget(key, field)
+    if cached is not None:
+        return cached
+
+    payload = json.dumps(build_spray_data(user_id, selected_date))
+    with redis_client.pipeline() as pipe:
+        pipe.hset(key, field, payload)
+        pipe.expire(key, SPRAY_CACHE_TTL)
+        pipe.execute()
+    return payload
+
+
+@app.route("/stats")
+def stats():
+    """Show average distance and miss pattern per club (optionally filtered by date)"""
+
+    selected_date = request.args.get("date")  # e.g. "2025-12-07" or None
+    user_id = g.user_id
 
-    spray_legend = []
+    # Average distance, shot count and miss buckets per club in one pass
+    club_query = f"""
+        SELECT clubs.id,
+               clubs.name,
+               clubs.notes,
+               ROUND(AVG(s.distance), 1) AS avg_distance,
+               COUNT(*) AS shot_count,
+               SUM(s.miss = 'left') AS left_cnt,
+               SUM(s.miss = 'center_left') AS center_left_cnt,
+               SUM(s.miss = 'center') AS center_cnt,
+               SUM(s.miss = 'center_right') AS center_right_cnt,
+               SUM(s.miss = 'right') AS right_cnt,
+               SUM(s.miss = 'other') AS other_cnt
+        FROM (
+            SELECT club_id,
+                   date,
+                   distance,
+                   {MISS_BUCKET_SQL} AS miss
+            FROM shots
+        ) AS s
+        JOIN clubs ON s.club_id = clubs.id
+        WHERE clubs.user_id = ?
+    """
+    club_params = [user_id]
+    if selected_date:
+        club_query += " AND s.date = ?\n"
+        club_params.append(selected_date)
+
+    club_query += """
+        GROUP BY clubs.id, clubs.name, clubs.notes
+        HAVING COUNT(*) > 0
+        ORDER BY COALESCE(clubs.bag_order, 999), clubs.name
+    """
+    club_stats = db_r.execute(club_query, *club_params)
+
+    # Turn bucket counts into percentages of all shots for the club
     for row in club_stats:
-        spray_legend.append(
-            {
-                "label": club_labels[row["id"]],
-                "color": club_colors[row["id"]],
-            }
-        )
+        total = row["shot_count"]
+        for bucket in BUCKETS:
+            count = row.pop(f"{bucket}_cnt") or 0
+            row[f"{bucket}_pct"] = round(100 * count / total, 1) if total > 0 else 0.0
 
+    # The spray chart is loaded separately from /stats/spray.json
     return render_template(
         "stats.html",
         stats=club_stats,
-        spray_shots=spray_shots,
-        spray_legend=spray_legend,
-        range_ticks=range_ticks,
         selected_date=selected_date,
     )
 
 
+@app.route("/stats/spray.json")
+def spray_json():
+    """Spray-chart data for /stats as JSON (optionally filtered by date)"""
+    payload = get_spray_json(g.user_id, request.args.get("date") or None)
+    return app.response_class(payload, mimetype="application/json")
+
+
 if __name__ == "__main__":
     app.run(debug=True)